@@ -10,10 +10,14 @@ os.makedirs(os.environ["STREAMLIT_HOME"], exist_ok=True)
 # Disable telemetry to avoid writes under root paths
 os.environ.setdefault("STREAMLIT_BROWSER_GATHER_USAGE_STATS", "false")
 
-from pathlib import Path
-from datetime import datetime
+import hashlib
+import re
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import time
+import httpx
 import streamlit as st
-from openai import OpenAI
+from openai import DefaultHttpxClient, OpenAI
 
 st.set_page_config(page_title="Urdu TTS - OpenAI", page_icon="🔊", layout="centered")
 
@@ -21,7 +25,8 @@ st.title("🔊 Urdu Text → Speech (OpenAI)")
 st.caption("Type Urdu text and generate natural Urdu speech with OpenAI TTS. Use a custom voice_id if your account has Voice access.")
 
 # ---- Get API key (your secret name is Key_1). Fallback to manual entry. ----
-API_KEY = os.getenv("Key_1") or st.secrets.get("Key_1")
+SECRET_KEY = os.getenv("Key_1") or st.secrets.get("Key_1")
+API_KEY = SECRET_KEY
 with st.sidebar:
     st.header("API")
     if not API_KEY:
@@ -30,7 +35,19 @@ with st.sidebar:
 if not API_KEY:
     st.stop()
 
-client = OpenAI(api_key=API_KEY)
+# Reuse one client (and its keep-alive HTTP/2 connection pool) across reruns.
+# Only the Space secret is cached; pasted keys get a per-run client so no
+# visitor-keyed pools pile up in the process.
+@st.cache_resource(show_spinner=False)
+def get_client(api_key: str) -> OpenAI:
+    http_client = DefaultHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=8),
+    )
+    return OpenAI(api_key=api_key, http_client=http_client)
+
+client = get_client(API_KEY) if API_KEY == SECRET_KEY else OpenAI(api_key=API_KEY)
+API_KEY_HASH = hashlib.sha256(API_KEY.encode()).hexdigest()
 
 # ---- Sidebar options ----
 with st.sidebar:
@@ -45,6 +62,9 @@ with st.sidebar:
 # ---- Input ----
 default_text = "یہ ایک سادہ مثال ہے۔ یہاں اپنا متن لکھیں اور آڈیو حاصل کریں۔"
 text = st.text_area("Urdu text", value=default_text, height=200, placeholder="یہاں اردو میں ٹیکسٹ لکھیں یا پیسٹ کریں…")
+text = text.strip()
+# OpenAI's per-request input limit; also caps how many paid chunk requests one click can fan out to
+MAX_INPUT_CHARS = 4096
 
 col1, col2 = st.columns(2)
 with col1:
@@ -52,35 +72,91 @@ with col1:
 with col2:
     clear_btn = st.button("🧹 Clear", use_container_width=True)
 
+# Preview renders further down, so clearing state here is enough (no rerun needed)
 if clear_btn:
     st.session_state.pop("audio_bytes", None)
     st.session_state.pop("ext", None)
-    st.experimental_rerun()
 
 # ---- TTS helper ----
-def synth_openai(urdu_text: str, voice: str, audio_format: str):
-    model = "gpt-4o-mini-tts"
-    ext = "mp3" if audio_format == "mp3" else "wav"
-    tmp_path = Path(f"/tmp/tts_{datetime.now().strftime('%H%M%S')}.{ext}")
-    # Stream to file to avoid loading all in memory
+PCM_SAMPLE_RATE = 24000  # OpenAI "pcm" output: raw 24 kHz, 16-bit, mono
+
+
+def wav_header(data_len: int, sample_rate: int = PCM_SAMPLE_RATE) -> bytes:
+    # 44-byte RIFF/WAVE header for 16-bit mono PCM
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_len, b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", data_len,
+    )
+
+
+_SENT_SPLIT = re.compile(r"(?<=[۔؟!\.])\s+")
+
+
+def split_urdu(t: str, lo: int = 60, hi: int = 200):
+    # Split on sentence terminators, then greedily merge into ~[lo, hi] char windows.
+    # Each chunk is a separate request, so text that fits in one window is never split.
+    if len(t) <= hi:
+        return [t]
+    chunks, cur = [], ""
+    for sent in _SENT_SPLIT.split(t):
+        if not sent:
+            continue
+        if cur and len(cur) >= lo and len(cur) + 1 + len(sent) > hi:
+            chunks.append(cur)
+            cur = sent
+        else:
+            cur = f"{cur} {sent}" if cur else sent
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+def _fetch_openai(chunk: str, voice: str, response_format: str) -> bytes:
+    buf = bytearray()
     with client.audio.speech.with_streaming_response.create(
-        model=model,
+        model="gpt-4o-mini-tts",
         voice=voice,
-        input=urdu_text,
-        format=("mp3" if audio_format == "mp3" else "wav"),
+        input=chunk,
+        response_format=response_format,
     ) as resp:
-        resp.stream_to_file(tmp_path)
-    data = tmp_path.read_bytes()
-    try:
-        tmp_path.unlink(missing_ok=True)
-    except Exception:
-        pass
-    return data, ext
+        for part in resp.iter_bytes(65536):
+            buf.extend(part)
+    return bytes(buf)
+
+
+def _synth_openai_uncached(urdu_text: str, voice: str, audio_format: str):
+    ext = "mp3" if audio_format == "mp3" else "wav"
+    if ext == "mp3":
+        # Separately encoded MP3 streams don't join seamlessly (encoder padding,
+        # per-stream Xing/Info frames), so MP3 is always a single request.
+        return _fetch_openai(urdu_text, voice, "mp3"), ext
+    # Raw PCM chunks concatenate sample-exactly under one WAV header
+    chunks = split_urdu(urdu_text)
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        parts = list(ex.map(lambda c: _fetch_openai(c, voice, "pcm"), chunks))
+    data = b"".join(parts)
+    return wav_header(len(data)) + data, ext
+
+
+# Identical (text, voice, format) requests are served from cache, not the API.
+# key_hash scopes entries to the API key that paid for them (the cache is shared across sessions).
+# Only inputs up to CACHE_MAX_CHARS are cached: ~1000 Urdu chars is ~75 s of speech, i.e.
+# <= ~3.6 MB as 24 kHz 16-bit WAV, so 64 entries stay under ~250 MB of RAM.
+CACHE_MAX_CHARS = 1000
+
+
+@st.cache_data(show_spinner=False, max_entries=64, ttl=3600)
+def synth_openai(urdu_text: str, voice: str, audio_format: str, key_hash: str):
+    return _synth_openai_uncached(urdu_text, voice, audio_format)
 
 # ---- Generate ----
 if make_audio:
-    if not text.strip():
+    if not text:
         st.warning("براہ کرم اردو متن درج کریں")
+    elif len(text) > MAX_INPUT_CHARS:
+        st.warning(f"Text is too long ({len(text)} characters). Please keep it under {MAX_INPUT_CHARS} characters.")
     else:
         try:
             voice_to_use = (custom_voice.strip() if use_custom else preset_voice)
@@ -88,7 +164,10 @@ if make_audio:
                 st.warning("Please choose a built-in voice or provide a custom voice_id.")
             else:
                 st.info("Generating Urdu speech with OpenAI TTS…")
-                audio_bytes, ext = synth_openai(text.strip(), voice_to_use, fmt)
+                if len(text) <= CACHE_MAX_CHARS:
+                    audio_bytes, ext = synth_openai(text, voice_to_use, fmt, API_KEY_HASH)
+                else:
+                    audio_bytes, ext = _synth_openai_uncached(text, voice_to_use, fmt)
                 st.session_state["audio_bytes"] = audio_bytes
                 st.session_state["ext"] = ext
                 st.success("آڈیو تیار ہے")
@@ -98,14 +177,17 @@ if make_audio:
 # ---- Preview & Download ----
 if "audio_bytes" in st.session_state:
     ext = st.session_state.get("ext", "mp3")
+    # One bytes reference and mime type shared by the player and the download button
+    audio_bytes = st.session_state["audio_bytes"]
+    mime = "audio/mpeg" if ext == "mp3" else "audio/wav"
     st.markdown("### ▶️ Preview")
-    st.audio(st.session_state["audio_bytes"], format=f"audio/{'mpeg' if ext=='mp3' else 'wav'}")
-    fname = f"{(out_name or 'urdu_tts').strip()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
+    st.audio(audio_bytes, format=mime)
+    fname = f"{(out_name or 'urdu_tts').strip()}_{time.strftime('%Y%m%d_%H%M%S')}.{ext}"
     st.download_button(
         "⬇️ Download",
-        data=st.session_state["audio_bytes"],
+        data=audio_bytes,
         file_name=fname,
-        mime=("audio/mpeg" if ext == "mp3" else "audio/wav"),
+        mime=mime,
         use_container_width=True,
     )
 